@@ -8,7 +8,8 @@ want to:
 body
 
 Searches your branch for a pattern of the form `<LABEL>-1234`, where `<LABEL>` is one of
-the `TICKET_LABELS` below. It then adds the ticket to the commit if the commit source is
+the `TICKET_LABELS` below, using the first (leftmost) ticket in the branch name if there
+are several, whatever the order of `TICKET_LABELS`. It then adds the ticket to the commit if the commit source is
 in the `SUPPORTED_SOURCES` below (see https://git-scm.com/docs/githooks or `githooks(5)`
 for details on these sources).
 
@@ -26,16 +27,38 @@ For example:
             Ticket: FOO-1234
 """
 
+from __future__ import annotations
+
+import os
 import re
-import subprocess
 import sys
-from typing import Iterable, Literal, Optional, Sequence
+
+# the hook's run time is mostly Python starting up, so avoid importing `typing` at
+# runtime: it's only needed for annotations (`typing.TYPE_CHECKING` without the import)
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Literal, Optional, Sequence, Tuple
 
 TICKET_LABELS = ("FOO", "BAR")
 TICKET_PREFIX = "Ticket: "
-SUPPORTED_SOURCES = (None, "message", "template", "commit")
+SUPPORTED_SOURCES = frozenset((None, "message", "template", "commit"))
+
+_AVAILABLE_SOURCES = frozenset(
+    (None, "message", "template", "merge", "squash", "commit")
+)
+# sources where the ticket is added to the commit body
+_EDITOR_SOURCES = frozenset((None, "message", "template", "commit"))
+
+_TICKET_PREFIX_BYTES = TICKET_PREFIX.encode()
 
-_AVAILABLE_SOURCES = (None, "message", "template", "merge", "squash", "commit")
+
+# a single alternation lets us find a ticket for any label in one scan, this matches the
+# leftmost ticket in the branch, regardless of the order of `TICKET_LABELS`
+_TICKET_RE = re.compile(f"(?:{'|'.join(map(re.escape, TICKET_LABELS))})-[0-9]+")
+
+_HEAD_BRANCH_PREFIX = "ref: refs/heads/"
+# the reftable backend leaves this placeholder in HEAD, the real value lives elsewhere
+_REFTABLE_HEAD = "ref: refs/heads/.invalid"
 
 # Returning nonzero would abort the commit
 # I don't think there's a good reason to ever abort the commit
@@ -44,99 +67,143 @@ def main(argv: Sequence[str]) -> Literal[0]:
     # see `githooks(5)` for details on expected args
     commit_msg_file = argv[1]
 
-    commit_source: Optional[str]
-    if len(argv) == 4:
-        commit_source = argv[2]
-    else:
-        commit_source = None
-
-    if commit_source in SUPPORTED_SOURCES:
-        branch = _get_branch()
-        if branch is not None:
-            ticket = _get_ticket_from_branch(branch, TICKET_LABELS)
-            if ticket is not None:
-                with open(commit_msg_file) as f:
-                    commit_content = f.read()
-                out_content = _add_ticket_to_commit(
-                    ticket, commit_source, commit_content
-                )
-                if out_content is not None:
-                    with open(commit_msg_file, "w") as f:
-                        f.write(out_content)
+    # the source is omitted when there is none, and may be followed by a commit SHA
+    commit_source: Optional[str] = argv[2] if len(argv) >= 3 else None
+
+    # bail out before doing any work for sources we'd ignore anyway
+    if commit_source not in SUPPORTED_SOURCES:
+        return 0
+
+    # git runs hooks from the root of the working tree, and sets `GIT_DIR` when the git
+    # dir is anywhere other than `.git` (e.g. in a worktree)
+    git_dir = os.environ.get("GIT_DIR", ".git")
+
+    branch = _get_branch(git_dir)
+    if branch is None:
+        return 0
+
+    ticket = _get_ticket_from_branch(branch)
+    if ticket is None:
+        return 0
+
+    # work in bytes: we never need to decode the commit message
+    with open(commit_msg_file, "rb+") as f:
+        commit_content = f.read()
+        insertion = _add_ticket_to_commit(ticket, commit_source, commit_content)
+        if insertion is not None:
+            location, ticket_text = insertion
+            if location != len(commit_content):
+                # the file only grows, so no need to truncate, and everything
+                # before `location` is left as is
+                f.seek(location)
+                ticket_text += commit_content[location:]
+            f.write(ticket_text)
 
     return 0
 
 
 def _add_ticket_to_commit(
-    ticket: str, commit_source: Optional[str], commit_content: str
-) -> Optional[str]:
-    ticket_string = TICKET_PREFIX + ticket
+    ticket: str, commit_source: Optional[str], commit_content: bytes
+) -> Optional[Tuple[int, bytes]]:
+    # check the source first, it's cheaper than searching the commit
+    if commit_source not in _EDITOR_SOURCES:
+        return None
+
+    ticket_string = _TICKET_PREFIX_BYTES + ticket.encode()
 
     # no-op if the ticket details already exist
     if ticket_string in commit_content:
         return None
 
-    if commit_source is None or commit_source in ("message", "commit"):
-        return _add_ticket_details(commit_content, ticket_string, commit_source)
-    else:
-        return None
+    return _add_ticket_details(commit_content, ticket_string, commit_source)
 
 
 def _add_ticket_details(
-    commit_content: str, ticket_string: str, commit_source: Optional[str]
-) -> str:
+    commit_content: bytes, ticket_string: bytes, commit_source: Optional[str]
+) -> Tuple[int, bytes]:
+    # returns where in `commit_content` to add the ticket details, and what to add
+    # find the first line starting with '#', if any
+    if commit_content.startswith(b"#"):
+        comment_location: Optional[int] = 0
+    elif (newline_location := commit_content.find(b"\n#")) != -1:
+        comment_location = newline_location + 1
+    else:
+        comment_location = None
 
-    comment_start = re.search("^#", commit_content, flags=re.MULTILINE)
-    if comment_start is not None:
+    if comment_location is not None:
         # commit open with editor: contents are the commit followed by
         # auto-generated comments
         # add the ticket between the end of the contents and the start of the comments
-        comment_location = comment_start.span(0)[0]
-        commit_text = commit_content[:comment_location]
-        commit_comments = commit_content[comment_location:]
-
-        ticket_string = f"\n{ticket_string}\n"
-        if commit_source is None:
-            ticket_string += "\n"
-
-        return commit_text + ticket_string + commit_comments
+        trailer = b"\n\n" if commit_source is None else b"\n"
+        return comment_location, b"\n" + ticket_string + trailer
     else:
         # commit not open with editor, just contains contents
         # append the ticket details
-        return commit_content + f"\n\n{ticket_string}\n"
+        return len(commit_content), b"\n\n" + ticket_string + b"\n"
 
 
-def _get_ticket_from_branch(branch: str, labels: Iterable[str]) -> Optional[str]:
-    for label in labels:
-        match = re.search(f"{re.escape(label)}-[0-9]+", branch)
-        if match is not None:
-            return match.group(0)
-    return None
+def _get_ticket_from_branch(branch: str) -> Optional[str]:
+    match = _TICKET_RE.search(branch)
+    return match.group(0) if match is not None else None
 
 
-def _get_branch() -> Optional[str]:
-    cmd = ("git", "rev-parse", "--abbrev-ref", "HEAD")
+def _get_branch(git_dir: str) -> Optional[str]:
+    # returns the branch to take the ticket from, if there is one. There's none for a
+    # detached HEAD, which also covers rebases, or during a cherry-pick: that copies an
+    # existing commit, so its message is left as is
+
+    # read the branch straight from HEAD rather than paying to start up git. This is
+    # a single small read, so there's nothing to gain from caching it between commits
     try:
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-    except OSError as e:
-        print(f"Failed to run `f{' '.join(cmd)}`: {e}", file=sys.stderr)
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+    except OSError:
+        return _get_branch_from_git()
+
+    if head == _REFTABLE_HEAD:
+        # CHERRY_PICK_HEAD isn't a file under reftable either, so leave it all to git
+        return _get_branch_from_git()
+    elif not head.startswith(_HEAD_BRANCH_PREFIX):
+        # detached HEAD
+        return None
+    elif os.path.exists(os.path.join(git_dir, "CHERRY_PICK_HEAD")):
         return None
+    else:
+        return head[len(_HEAD_BRANCH_PREFIX) :]
 
-    stdout, stderr = proc.communicate()
-    stdout_text = stdout.decode() if stdout is not None else ""
-    stderr_text = stderr.decode() if stderr is not None else ""
 
-    if proc.returncode != 0:
-        print(
-            f"`{' '.join(cmd)}` failed: {stdout_text}, {stderr_text}", file=sys.stderr
-        )
+def _get_branch_from_git() -> Optional[str]:
+    # `--quiet`: for both commands a missing ref just means a non-zero exit, not an
+    # error
+    cherry_pick = _run_git("rev-parse", "--quiet", "--verify", "CHERRY_PICK_HEAD")
+    if cherry_pick is None or cherry_pick[0] == 0:
+        # failed to run git, or a cherry-pick is in progress
+        return None
+
+    symbolic_ref = _run_git("symbolic-ref", "--quiet", "--short", "HEAD")
+    if symbolic_ref is None or symbolic_ref[0] != 0:
         return None
     else:
-        return stdout_text
+        return symbolic_ref[1].rstrip("\n")
+
+
+def _run_git(*args: str) -> Optional[Tuple[int, str]]:
+    # only imported on this fallback path: it's slow to import
+    import subprocess
+
+    cmd = ("git", *args)
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    except OSError as e:
+        print(f"Failed to run `{' '.join(cmd)}`: {e}", file=sys.stderr)
+        return None
+
+    if proc.returncode != 0 and (proc.stdout or proc.stderr):
+        print(
+            f"`{' '.join(cmd)}` failed: {proc.stdout}, {proc.stderr}",
+            file=sys.stderr,
+        )
+    return proc.returncode, proc.stdout
 
 
 if __name__ == "__main__":
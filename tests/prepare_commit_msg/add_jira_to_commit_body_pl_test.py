@@ -3,65 +3,37 @@ import shutil
 import subprocess
 from pathlib import Path
 from textwrap import dedent
-from typing import Optional, Tuple
+from typing import Tuple
 from unittest import mock
 
 import pytest
 
 
-def run_cmd(*args: str) -> Tuple[Optional[bytes], Optional[bytes], int]:
+def run_cmd(*args: str) -> Tuple[bytes, bytes, int]:
     try:
-        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        proc = subprocess.run(args, capture_output=True, check=False)
     except OSError as e:
         assert False, f"Failed to run `{' '.join(args)}`: {e}"
     else:
-        stdout, stderr = proc.communicate()
-
-        returncode = proc.returncode
         if proc.returncode != 0:
-            stdout_text = stdout if stdout is not None else ""
-            stderr_text = stderr if stderr is not None else ""
-            assert False, f"`{' '.join(args)}` failed: {stdout_text}, {stderr_text}"
+            assert False, f"`{' '.join(args)}` failed: {proc.stdout}, {proc.stderr}"
         else:
-            return stdout, stderr, returncode
-
-
-@pytest.fixture
-def git_dir(tmpdir) -> str:
-    run_cmd("git", "init", tmpdir),
-    yield tmpdir
-
-
-@pytest.fixture
-def ticket():
-    return "FOO-123"
-
-
-# run without opening an editor, ":"
-# and opening opening an editor that does nothing, "true"
-@pytest.fixture(params=("true", ":"))
-def editor(request):
-    return request.param
+            return proc.stdout, proc.stderr, proc.returncode
 
 
-@pytest.fixture(
-    params=("{}-great-new-feature", "feature/{}-new-feature", "{}/new-feature")
-)
-def branch_name(request, ticket):
-    return request.param.format(ticket)
-
-
-@pytest.fixture(autouse=True)
-def init_git_repo(git_dir, request, branch_name):
+# build a repo with the hook installed once, and copy it for each test, rather than
+# running all the git commands to set it up again every time
+@pytest.fixture(scope="session")
+def template_git_dir(tmpdir_factory, pytestconfig) -> str:
+    template_dir = tmpdir_factory.mktemp("template")
     script_path = (
-        Path(request.config.rootpath)
+        Path(pytestconfig.rootpath)
         / "prepare-commit-msg"
         / "add-jira-to-commit-body.py"
     )
 
-    with git_dir.as_cwd():
-        run_cmd("git", "checkout", "--orphan", branch_name)
-
+    run_cmd("git", "init", template_dir)
+    with template_dir.as_cwd():
         # Add a commit so a branch is defined
         run_cmd(
             "git",
@@ -71,10 +43,41 @@ def init_git_repo(git_dir, request, branch_name):
             "--message",
             "First commit",
         )
-        shutil.copy(script_path, Path(git_dir) / ".git" / "hooks" / "prepare-commit-msg")
+        shutil.copy(
+            script_path, Path(template_dir) / ".git" / "hooks" / "prepare-commit-msg"
+        )
         # Ensure we use the hook we just copied
         run_cmd("git", "config", "--local", "--add", "core.hooksPath", ".git/hooks")
 
+    return template_dir
+
+
+@pytest.fixture
+def git_dir(tmpdir, template_git_dir, branch_name) -> str:
+    shutil.copytree(template_git_dir, tmpdir, symlinks=True, dirs_exist_ok=True)
+    with tmpdir.as_cwd():
+        run_cmd("git", "branch", "--move", branch_name)
+    yield tmpdir
+
+
+@pytest.fixture
+def ticket():
+    return "FOO-123"
+
+
+# run without opening an editor, ":"
+# and opening opening an editor that does nothing, "true"
+@pytest.fixture(params=("true", ":"))
+def editor(request):
+    return request.param
+
+
+# the different forms of branch name are covered by
+# add_jira_to_commit_body_script_test.py, which is much quicker to run
+@pytest.fixture
+def branch_name(ticket):
+    return f"{ticket}-great-new-feature"
+
 
 def test_bare_commit(git_dir, ticket, editor):
     expected_commit_subject = f"Ticket: {ticket}"
@@ -168,9 +171,27 @@ def test_with_message(git_dir, ticket):
     assert log_stdout.decode() == expected_commit_body
 
 
-def test_with_merge_commit(git_dir, ticket):
+def test_with_template(git_dir, ticket, editor):
+    expected_commit_body = f"Ticket: {ticket}\n"
+
+    with git_dir.as_cwd():
+        Path("template.txt").write_text("Template subject\n")
+        run_cmd("git", "config", "--local", "commit.template", "template.txt")
+
+        with mock.patch.dict(os.environ, {"GIT_EDITOR": editor}):
+            run_cmd("git", "commit", "--allow-empty")
+
+        log_stdout, log_stderr, _ = run_cmd(
+            "git", "log", "--max-count", "1", "--format=format:%s%n%b"
+        )
+
+    assert log_stdout.decode() == f"Template subject\n{expected_commit_body}"
+
+
+def test_with_merge_commit(git_dir):
     merge_subject = "Merge the other commit"
-    expected_merge_body = f"Ticket: {ticket}\n"
+    # merge isn't a supported source, so no ticket is added
+    expected_merge_body = ""
     other_branch = "another_branch"
 
     with git_dir.as_cwd():
@@ -216,3 +237,63 @@ def test_with_merge_commit(git_dir, ticket):
         )
 
     assert log_stdout.decode() == expected_merge_body
+
+
+def test_with_cherry_pick(git_dir):
+    other_branch = "another_branch"
+
+    with git_dir.as_cwd():
+        run_cmd("git", "checkout", "-b", other_branch)
+        run_cmd(
+            "git",
+            "commit",
+            "--allow-empty",
+            "--no-edit",
+            "--message",
+            "Commit on the other branch",
+        )
+        run_cmd("git", "checkout", "@{-1}")
+
+        run_cmd("git", "cherry-pick", "--allow-empty", other_branch)
+
+        log_stdout, log_stderr, _ = run_cmd(
+            "git", "log", "--max-count", "1", "--format=format:%B"
+        )
+
+    # the commit is copied as is, without a ticket
+    assert log_stdout.decode() == "Commit on the other branch\n"
+
+
+# run a plain rebase, and an interactive one rewording each commit
+@pytest.mark.parametrize(
+    ("rebase_flag", "sequence_editor"),
+    (
+        ("--force-rebase", ":"),
+        ("--interactive", "sed -i.bak -e s/^pick/reword/"),
+    ),
+)
+def test_rebasing(rebase_flag, sequence_editor, git_dir, editor):
+    with git_dir.as_cwd():
+        # create the commit without the hook, so it has no ticket to begin with
+        Path("new-file").write_text("content\n")
+        run_cmd("git", "add", "new-file")
+        run_cmd(
+            "git",
+            "-c",
+            "core.hooksPath=/dev/null",
+            "commit",
+            "--no-edit",
+            "--message",
+            "Commit to rebase",
+        )
+
+        with mock.patch.dict(
+            os.environ, {"GIT_EDITOR": editor, "GIT_SEQUENCE_EDITOR": sequence_editor}
+        ):
+            run_cmd("git", "rebase", rebase_flag, "HEAD~1")
+
+        log_stdout, log_stderr, _ = run_cmd(
+            "git", "log", "--max-count", "1", "--format=format:%B"
+        )
+
+    assert log_stdout.decode() == "Commit to rebase\n"
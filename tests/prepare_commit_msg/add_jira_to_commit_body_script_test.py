@@ -0,0 +1,210 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+# Run the hook directly against a prepared commit message file, the way git
+# would, without going through all of `git commit`
+
+
+@pytest.fixture
+def script_path(request) -> Path:
+    return (
+        Path(request.config.rootpath)
+        / "prepare-commit-msg"
+        / "add-jira-to-commit-body.py"
+    )
+
+
+@pytest.fixture
+def ticket():
+    return "FOO-123"
+
+
+@pytest.fixture(
+    params=("{}-great-new-feature", "feature/{}-new-feature", "{}/new-feature")
+)
+def branch_name(request, ticket):
+    return request.param.format(ticket)
+
+
+@pytest.fixture
+def git_dir(tmpdir, branch_name) -> str:
+    tmpdir.mkdir(".git").join("HEAD").write(f"ref: refs/heads/{branch_name}\n")
+    yield tmpdir
+
+
+def run_git(*args: str) -> None:
+    subprocess.run(
+        (
+            "git",
+            "-c",
+            "user.name=Test User",
+            "-c",
+            "user.email=test@example.com",
+            *args,
+        ),
+        check=True,
+        capture_output=True,
+    )
+
+
+def run_hook(
+    script_path: Path,
+    git_dir,
+    commit_content: str,
+    commit_source: Optional[str] = None,
+    *extra_args: str,
+) -> str:
+    commit_msg_file = git_dir.join("COMMIT_EDITMSG")
+    commit_msg_file.write(commit_content)
+
+    args = [sys.executable, str(script_path), str(commit_msg_file)]
+    if commit_source is not None:
+        args.append(commit_source)
+    args.extend(extra_args)
+
+    env = {k: v for k, v in os.environ.items() if k != "GIT_DIR"}
+    proc = subprocess.run(args, cwd=git_dir, env=env, capture_output=True)
+    assert proc.returncode == 0, f"hook failed: {proc.stdout}, {proc.stderr}"
+    assert proc.stderr == b"", f"hook reported errors: {proc.stderr}"
+
+    return commit_msg_file.read()
+
+
+def test_message(script_path, git_dir, ticket):
+    out = run_hook(script_path, git_dir, "Add the new feature\n", "message")
+
+    assert out == f"Add the new feature\n\n\nTicket: {ticket}\n"
+
+
+def test_editor(script_path, git_dir, ticket):
+    commit_content = "\n# Please enter the commit message for your changes.\n"
+
+    out = run_hook(script_path, git_dir, commit_content)
+
+    assert out == (
+        f"\n\nTicket: {ticket}\n\n# Please enter the commit message for your changes.\n"
+    )
+
+
+def test_commit_with_comments(script_path, git_dir, ticket):
+    commit_content = "First commit\n# Please enter the commit message.\n"
+
+    out = run_hook(script_path, git_dir, commit_content, "commit", "abc123")
+
+    assert (
+        out == f"First commit\n\nTicket: {ticket}\n# Please enter the commit message.\n"
+    )
+
+
+# `commit.template` is set: the template followed by the usual comments
+def test_template(script_path, git_dir, ticket):
+    commit_content = "Template subject\n\n# Please enter the commit message.\n"
+
+    out = run_hook(script_path, git_dir, commit_content, "template")
+
+    assert out == (
+        f"Template subject\n\n\nTicket: {ticket}\n# Please enter the commit message.\n"
+    )
+
+
+def test_ticket_already_present(script_path, git_dir, ticket):
+    commit_content = f"Add the new feature\n\nTicket: {ticket}\n"
+
+    assert run_hook(script_path, git_dir, commit_content, "message") == commit_content
+
+
+@pytest.mark.parametrize("commit_source", ("merge", "squash"))
+def test_unsupported_source(script_path, git_dir, commit_source):
+    commit_content = "Some message\n"
+
+    assert run_hook(script_path, git_dir, commit_content, commit_source) == (
+        commit_content
+    )
+
+
+def test_cherry_pick(script_path, git_dir):
+    git_dir.join(".git", "CHERRY_PICK_HEAD").write(
+        "2c49333eabcd2f92d39a341ebaf47bbdb2e5b275\n"
+    )
+    commit_content = "Some message\n"
+
+    assert run_hook(script_path, git_dir, commit_content, "message") == commit_content
+
+
+# the leftmost ticket is used, regardless of the order of the labels
+@pytest.mark.parametrize("branch_name", ("BAR-1/FOO-2",))
+def test_multiple_tickets_in_branch(script_path, git_dir):
+    out = run_hook(script_path, git_dir, "Add the new feature\n", "message")
+
+    assert out == "Add the new feature\n\n\nTicket: BAR-1\n"
+
+
+@pytest.mark.parametrize("branch_name", ("main", "FOO-new-feature"))
+def test_no_ticket_in_branch(script_path, git_dir):
+    commit_content = "Some message\n"
+
+    assert run_hook(script_path, git_dir, commit_content, "message") == commit_content
+
+
+def test_detached_head(script_path, git_dir):
+    git_dir.join(".git", "HEAD").write("2c49333eabcd2f92d39a341ebaf47bbdb2e5b275\n")
+    commit_content = "Some message\n"
+
+    assert run_hook(script_path, git_dir, commit_content, "message") == commit_content
+
+
+# in the tests below HEAD can't be used directly, so the hook has to ask git
+
+
+def test_git_dir_is_file(script_path, tmpdir, branch_name, ticket):
+    # `.git` is a file pointing to the real git dir, and `GIT_DIR` isn't set
+    worktree = tmpdir.join("worktree")
+    run_git("init", "--separate-git-dir", str(tmpdir.join("repo.git")), str(worktree))
+    run_git("-C", str(worktree), "symbolic-ref", "HEAD", f"refs/heads/{branch_name}")
+
+    out = run_hook(script_path, worktree, "Add the new feature\n", "message")
+
+    assert out == f"Add the new feature\n\n\nTicket: {ticket}\n"
+
+
+def test_git_dir_is_file_detached_head(script_path, tmpdir):
+    worktree = tmpdir.join("worktree")
+    run_git("init", "--separate-git-dir", str(tmpdir.join("repo.git")), str(worktree))
+    run_git("-C", str(worktree), "commit", "--allow-empty", "--message", "First")
+    run_git("-C", str(worktree), "checkout", "--detach")
+    commit_content = "Some message\n"
+
+    # no ticket, and nothing reported to the user
+    assert run_hook(script_path, worktree, commit_content, "message") == commit_content
+
+
+def test_reftable_head(script_path, tmpdir, branch_name, ticket):
+    run_git("init", str(tmpdir))
+    run_git("-C", str(tmpdir), "symbolic-ref", "HEAD", f"refs/heads/{branch_name}")
+    # this `.git` only holds the placeholder HEAD the reftable backend writes, so
+    # isn't a valid git dir and git finds the real repo above it instead
+    subdir = tmpdir.mkdir("subdir")
+    subdir.mkdir(".git").join("HEAD").write("ref: refs/heads/.invalid\n")
+
+    out = run_hook(script_path, subdir, "Add the new feature\n", "message")
+
+    assert out == f"Add the new feature\n\n\nTicket: {ticket}\n"
+
+
+def test_reftable_head_cherry_pick(script_path, tmpdir, branch_name):
+    run_git("init", str(tmpdir))
+    run_git("-C", str(tmpdir), "symbolic-ref", "HEAD", f"refs/heads/{branch_name}")
+    run_git("-C", str(tmpdir), "commit", "--allow-empty", "--message", "First")
+    run_git("-C", str(tmpdir), "update-ref", "CHERRY_PICK_HEAD", "HEAD")
+    # as above, and there's no CHERRY_PICK_HEAD file here either: only git knows
+    # about the cherry-pick, like with reftable
+    subdir = tmpdir.mkdir("subdir")
+    subdir.mkdir(".git").join("HEAD").write("ref: refs/heads/.invalid\n")
+    commit_content = "Some message\n"
+
+    assert run_hook(script_path, subdir, commit_content, "message") == commit_content